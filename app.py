@@ -1,8 +1,19 @@
+import gzip
+import hashlib
 import json
+import mimetypes
 import os
-from flask import Flask, Response
+import threading
+from datetime import datetime, timezone
+from flask import Flask, Response, send_from_directory
 from flask import render_template
-from flask import redirect, request
+from flask import abort, redirect, request
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 app = Flask(__name__)
 
@@ -12,9 +23,114 @@ def redirect_to_canonical_domain():
     if request.host.startswith("www."):
         return redirect(f"https://{preferred_domain}{request.path}", code=301)
 
+# Responses that only change per deploy (or per day) are built once per
+# worker, kept with gzip/brotli variants, and revalidated with ETags.
+PAGE_MAX_AGE = 300
+# Only for versioned static URLs (see version_static_urls); anything else
+# is revalidated against its ETag on every use
+STATIC_MAX_AGE = 24 * 60 * 60
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'application/xml', 'image/svg+xml')
+
+
+class PrecomputedResponse:
+    def __init__(self, body, mimetype, last_modified, max_age):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        self.mimetype = mimetype
+        self.last_modified = last_modified
+        self.max_age = max_age
+        etag = hashlib.sha1(body).hexdigest()
+        self.variants = {'identity': (body, etag)}
+        if mimetype.startswith(COMPRESSIBLE_TYPES):
+            self.variants['gzip'] = (gzip.compress(body, 9, mtime=0), etag + '-gz')
+            if brotli is not None:
+                self.variants['br'] = (brotli.compress(body), etag + '-br')
+
+    def respond(self):
+        encoding = 'identity'
+        for candidate in ('br', 'gzip'):
+            if candidate in self.variants and request.accept_encodings[candidate]:
+                encoding = candidate
+                break
+        body, etag = self.variants[encoding]
+        response = Response(body, mimetype=self.mimetype)
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+        if len(self.variants) > 1:
+            response.vary.add('Accept-Encoding')
+        response.set_etag(etag)
+        response.last_modified = self.last_modified
+        response.cache_control.public = True
+        response.cache_control.max_age = self.max_age
+        if not self.max_age:
+            response.cache_control.no_cache = True
+        return response.make_conditional(request)
+
+
+_precomputed = {}
+_precomputed_lock = threading.Lock()
+
+
+def serve_precomputed(key, build, mimetype, version=None, last_modified=None, max_age=PAGE_MAX_AGE):
+    # build() runs again only when `version` changes (e.g. the date or a file mtime)
+    with _precomputed_lock:
+        entry = _precomputed.get(key)
+        if entry is None or entry[0] != version:
+            modified = last_modified or datetime.now(timezone.utc).replace(microsecond=0)
+            entry = (version, PrecomputedResponse(build(), mimetype, modified, max_age))
+            _precomputed[key] = entry
+    return entry[1].respond()
+
+
+def static_version(path):
+    return str(int(os.path.getmtime(path)))
+
+
+@app.url_defaults
+def version_static_urls(endpoint, values):
+    # url_for('static', ...) gets ?v=<mtime>, so a deploy changes the URL of
+    # every file it touches and pages never pair with a stale cached copy
+    if endpoint == 'static' and 'filename' in values:
+        path = safe_join(app.static_folder, values['filename'])
+        if path is not None and os.path.isfile(path):
+            values.setdefault('v', static_version(path))
+
+
+def static_file(filename):
+    path = safe_join(app.static_folder, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    mtime = os.path.getmtime(path)
+    max_age = STATIC_MAX_AGE if request.args.get('v') == static_version(path) else 0
+    mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    if not mimetype.startswith(COMPRESSIBLE_TYPES):
+        # Images are already compressed; werkzeug streams them with validators
+        return send_from_directory(app.static_folder, filename, mimetype=mimetype, max_age=max_age)
+
+    def build():
+        with open(path, 'rb') as f:
+            return f.read()
+
+    return serve_precomputed(('static', filename, max_age), build, mimetype, version=mtime,
+                             last_modified=datetime.fromtimestamp(int(mtime), timezone.utc),
+                             max_age=max_age)
+
+
+app.view_functions['static'] = static_file
+
+
 @app.route('/sitemap.xml')
 def sitemap():
     from datetime import date
+
+    response = serve_precomputed('sitemap.xml', build_sitemap, 'application/xml', version=date.today(),
+                                 max_age=60 * 60)
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    return response
+
+
+def build_sitemap():
+    from datetime import date
     from xml.etree.ElementTree import Element, SubElement, tostring
     import xml.dom.minidom
 
@@ -74,30 +190,527 @@ def sitemap():
 
     rough_string = tostring(urlset, 'utf-8')
     reparsed = xml.dom.minidom.parseString(rough_string)
-    pretty_xml = reparsed.toprettyxml(indent="  ", encoding="utf-8").decode("utf-8")
-
-    response = Response(pretty_xml, mimetype='application/xml')
-    response.headers['X-Content-Type-Options'] = 'nosniff'
-    return response
+    return reparsed.toprettyxml(indent="  ", encoding="utf-8").decode("utf-8")
 
 
 @app.route('/')
 def index():
-    return render_template('index.html')
+    return serve_precomputed('index.html', lambda: render_template('index.html'), 'text/html')
 
 @app.route('/about')
 def about():
-    return render_template('about.html')
+    return serve_precomputed('about.html', lambda: render_template('about.html'), 'text/html')
 
 from flask import request, send_file, jsonify
-from pdf2image import convert_from_bytes
+from pdf2image import convert_from_path, pdfinfo_from_path
+from pdf2image.exceptions import PDFPageCountError, PDFSyntaxError
 from PIL import Image
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait as wait_futures
+from concurrent.futures.process import BrokenProcessPool
+import collections
+import contextlib
+import fcntl
+import glob
 import io
+import random
+import resource
+import shutil
+import sqlite3
+import tempfile
+import time
+import uuid
 import zipfile
 
+# Pages rendered per pdftoppm call when streaming a conversion
+PAGE_WINDOW = 4
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Conversion cache shared by all workers: artifacts live as files under
+# CACHE_DIR and a SQLite index tracks size, age and last access.
+CACHE_DIR = os.environ.get('CACHE_DIR', os.path.join(tempfile.gettempdir(), 'pdf2jpg-cache'))
+CACHE_MAX_BYTES = int(os.environ.get('CACHE_MAX_BYTES', 1024 * 1024 * 1024))
+CACHE_TTL = int(os.environ.get('CACHE_TTL', 24 * 60 * 60))
+# A temp file not written to for this long belongs to a killed worker
+CACHE_ORPHAN_AGE = 60 * 60
+
+
+@contextlib.contextmanager
+def sqlite_transaction(db_path):
+    # One short write transaction per call; safe to use from any worker
+    db = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    try:
+        db.execute('BEGIN IMMEDIATE')
+    except BaseException:
+        # e.g. "database is locked": there is no transaction to roll back
+        db.close()
+        raise
+    try:
+        yield db
+        db.execute('COMMIT')
+    except BaseException:
+        db.execute('ROLLBACK')
+        raise
+    finally:
+        db.close()
+
+
+@contextlib.contextmanager
+def sqlite_read(db_path):
+    # Autocommit connection for plain SELECTs: each one is its own deferred
+    # read, so under WAL it never waits on the write lock
+    db = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def sqlite_enable_wal(db_path):
+    # WAL lets readers in other workers proceed during writes; the mode is
+    # persistent but can only be switched outside a transaction
+    db = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    try:
+        db.execute('PRAGMA journal_mode=WAL')
+    finally:
+        db.close()
+
+
+class CacheEntry:
+    # Temp file in the cache directory, published atomically on commit()
+    def __init__(self, cache, key):
+        self.cache = cache
+        self.key = key
+        fd, self.tmp_path = tempfile.mkstemp(dir=cache.root, suffix='.tmp')
+        self.file = os.fdopen(fd, 'wb')
+
+    def write(self, data):
+        self.file.write(data)
+
+    def commit(self):
+        self.file.close()
+        self.cache._publish(self.key, self.tmp_path)
+
+    def discard(self):
+        self.file.close()
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self.tmp_path)
+
+
+class ConversionCache:
+    def __init__(self, root, max_bytes, ttl):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        os.makedirs(root, exist_ok=True)
+        self.db_path = os.path.join(root, 'index.sqlite3')
+        sqlite_enable_wal(self.db_path)
+        with self._db() as db:
+            db.execute('CREATE TABLE IF NOT EXISTS entries '
+                       '(key TEXT PRIMARY KEY, size INTEGER NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)')
+            db.execute('CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)')
+            db.execute('CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+        self._last_sweep = 0
+        self._sweep_orphans(time.time())
+
+    def _db(self):
+        return sqlite_transaction(self.db_path)
+
+    @staticmethod
+    def _count(db, name, amount=1):
+        db.execute('INSERT INTO stats (name, value) VALUES (?, ?) '
+                   'ON CONFLICT (name) DO UPDATE SET value = value + excluded.value', (name, amount))
+
+    def _path(self, key):
+        return os.path.join(self.root, key)
+
+    @staticmethod
+    def key_for(streams, **params):
+        # Hash of the uploaded bytes plus the parameters that shape the output
+        digest = hashlib.sha256(json.dumps(params, sort_keys=True).encode())
+        for stream in streams:
+            stream.seek(0)
+            size = 0
+            for chunk in iter(lambda: stream.read(STREAM_CHUNK_SIZE), b''):
+                digest.update(chunk)
+                size += len(chunk)
+            digest.update(size.to_bytes(8, 'big'))
+            stream.seek(0)
+        return digest.hexdigest()
+
+    def open(self, key):
+        # Returns an open file for a fresh entry (counted as a hit), else None.
+        # Holding the handle keeps the bytes readable even if evicted meanwhile.
+        now = time.time()
+        with self._db() as db:
+            row = db.execute('SELECT size, created FROM entries WHERE key = ?', (key,)).fetchone()
+            if row and now - row[1] < self.ttl:
+                try:
+                    f = open(self._path(key), 'rb')
+                except FileNotFoundError:
+                    f = None
+                if f is not None:
+                    db.execute('UPDATE entries SET accessed = ? WHERE key = ?', (now, key))
+                    self._count(db, 'hits')
+                    self._count(db, 'hit_bytes', row[0])
+                    return f
+            if row:
+                db.execute('DELETE FROM entries WHERE key = ?', (key,))
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(self._path(key))
+            self._count(db, 'misses')
+        return None
+
+    def entry(self, key):
+        return CacheEntry(self, key)
+
+    def _publish(self, key, tmp_path):
+        now = time.time()
+        size = os.path.getsize(tmp_path)
+        with self._db() as db:
+            os.replace(tmp_path, self._path(key))
+            db.execute('INSERT OR REPLACE INTO entries (key, size, created, accessed) VALUES (?, ?, ?, ?)',
+                       (key, size, now, now))
+            self._evict(db, now)
+
+    def _evict(self, db, now):
+        # Drop expired entries, then least recently used ones until under budget
+        expired = db.execute('SELECT key FROM entries WHERE created <= ?', (now - self.ttl,)).fetchall()
+        total = db.execute('SELECT COALESCE(SUM(size), 0) FROM entries WHERE created > ?',
+                           (now - self.ttl,)).fetchone()[0]
+        victims = [key for (key,) in expired]
+        if total > self.max_bytes:
+            for key, size in db.execute('SELECT key, size FROM entries WHERE created > ? ORDER BY accessed',
+                                        (now - self.ttl,)):
+                victims.append(key)
+                total -= size
+                if total <= self.max_bytes:
+                    break
+        for key in victims:
+            db.execute('DELETE FROM entries WHERE key = ?', (key,))
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(self._path(key))
+        if victims:
+            self._count(db, 'evictions', len(victims))
+        if now - self._last_sweep > CACHE_ORPHAN_AGE / 4:
+            self._sweep_orphans(now)
+
+    def _sweep_orphans(self, now):
+        # Entries a killed worker never got to commit() or discard(); they
+        # are not in the index, so eviction and the byte budget miss them
+        self._last_sweep = now
+        with os.scandir(self.root) as entries:
+            for entry in entries:
+                if not entry.name.endswith('.tmp'):
+                    continue
+                with contextlib.suppress(FileNotFoundError):
+                    if now - entry.stat().st_mtime > CACHE_ORPHAN_AGE:
+                        os.remove(entry.path)
+
+    def stats(self):
+        with self._db() as db:
+            counters = dict(db.execute('SELECT name, value FROM stats'))
+            entries, size = db.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries').fetchone()
+        return {
+            'hits': counters.get('hits', 0),
+            'misses': counters.get('misses', 0),
+            'hit_bytes': counters.get('hit_bytes', 0),
+            'evictions': counters.get('evictions', 0),
+            'entries': entries,
+            'bytes': size,
+        }
+
+
+def cache_stream(chunks, cache, key):
+    # Tee a streamed response into a cache entry; only complete outputs are kept
+    entry = cache.entry(key)
+    try:
+        for chunk in chunks:
+            entry.write(chunk)
+            yield chunk
+    except BaseException:
+        entry.discard()
+        raise
+    entry.commit()
+
+
+conversion_cache = ConversionCache(CACHE_DIR, CACHE_MAX_BYTES, CACHE_TTL)
+
+
+# Per-stage timings, sizes and sampled RSS, stored as Prometheus histograms in a
+# SQLite file so /metrics sums every gunicorn worker. PERF_LOG=1 also logs
+# one JSON timing line per request.
+METRICS_DB = os.environ.get('METRICS_DB', os.path.join(tempfile.gettempdir(), 'pdf2jpg-metrics.sqlite3'))
+PERF_LOG = os.environ.get('PERF_LOG') == '1'
+MB = 1024 * 1024
+HISTOGRAMS = {
+    'pdf2jpg_request_seconds': ('Conversion request duration.',
+                                (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)),
+    'pdf2jpg_stage_seconds': ('Time spent in each conversion stage.',
+                              (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)),
+    'pdf2jpg_pages': ('Pages per conversion.', (1, 2, 5, 10, 25, 50, 100, 250, 500)),
+    'pdf2jpg_input_bytes': ('Uploaded bytes per conversion.',
+                            (64 * 1024, 256 * 1024, MB, 4 * MB, 16 * MB, 64 * MB, 256 * MB)),
+    'pdf2jpg_output_bytes': ('Response bytes per conversion.',
+                             (64 * 1024, 256 * 1024, MB, 4 * MB, 16 * MB, 64 * MB, 256 * MB, 1024 * MB)),
+    'pdf2jpg_rss_bytes': ('Resident set size of the worker and its render processes, sampled as each '
+                          'conversion finishes. Shared by concurrent requests, not a per-request peak.',
+                          (64 * MB, 128 * MB, 256 * MB, 512 * MB, 1024 * MB, 2048 * MB, 4096 * MB)),
+}
+
+
+def process_rss(pid):
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def child_pids(pid):
+    children = []
+    for task in os.listdir(f"/proc/{pid}/task"):
+        with contextlib.suppress(OSError):
+            with open(f"/proc/{pid}/task/{task}/children") as f:
+                children += [int(child) for child in f.read().split()]
+    return children
+
+
+def worker_rss():
+    # Current RSS of this worker plus its descendants (the render pool and
+    # any pdftocairo they are running). Without /proc, fall back to the
+    # worker's own lifetime peak.
+    total, pending = 0, [os.getpid()]
+    while pending:
+        pid = pending.pop()
+        with contextlib.suppress(OSError):
+            total += process_rss(pid)
+            pending += child_pids(pid)
+    if total:
+        return total
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def format_sample(value):
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+class MetricsStore:
+    def __init__(self, db_path):
+        self.db_path = db_path
+        sqlite_enable_wal(db_path)
+        with sqlite_transaction(db_path) as db:
+            db.execute('CREATE TABLE IF NOT EXISTS samples (name TEXT NOT NULL, labels TEXT NOT NULL, '
+                       'le TEXT NOT NULL, value REAL NOT NULL, PRIMARY KEY (name, labels, le))')
+
+    def observe(self, observations):
+        # observations: (histogram name, labels dict, value)
+        rows = []
+        for name, labels, value in observations:
+            label_text = ','.join(f'{k}="{v}"' for k, v in sorted(labels.items()))
+            rows += [(name, label_text, repr(float(le)), 1) for le in HISTOGRAMS[name][1] if value <= le]
+            rows += [(name, label_text, '+Inf', 1), (name, label_text, 'sum', value)]
+        with sqlite_transaction(self.db_path) as db:
+            db.executemany('INSERT INTO samples (name, labels, le, value) VALUES (?, ?, ?, ?) '
+                           'ON CONFLICT (name, labels, le) DO UPDATE SET value = value + excluded.value', rows)
+
+    def render(self):
+        series = collections.defaultdict(lambda: collections.defaultdict(dict))
+        with sqlite_transaction(self.db_path) as db:
+            for name, labels, le, value in db.execute('SELECT name, labels, le, value FROM samples'):
+                series[name][labels][le] = value
+        lines = []
+        for name, (help_text, buckets) in HISTOGRAMS.items():
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+            for labels, values in sorted(series[name].items()):
+                prefix = labels + ',' if labels else ''
+                for le in [repr(float(b)) for b in buckets] + ['+Inf']:
+                    lines.append(f'{name}_bucket{{{prefix}le="{le}"}} {format_sample(values.get(le, 0))}')
+                lines.append(f"{name}_sum{{{labels}}} {format_sample(values.get('sum', 0))}")
+                lines.append(f"{name}_count{{{labels}}} {format_sample(values.get('+Inf', 0))}")
+        return lines
+
+
+metrics_store = MetricsStore(METRICS_DB)
+
+
+class RequestMetrics:
+    # Collects one conversion's stage timings; finish() records them once
+    def __init__(self, route):
+        self.route = route
+        self.start = time.perf_counter()
+        self.stages = collections.defaultdict(float)
+        self.pages = 0
+        self.input_bytes = 0
+        self.output_bytes = 0
+        self.cache = 'miss'
+        self.finished = False
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        # Called from decode threads as well as the request thread
+        with self._lock:
+            self.stages[stage] += seconds
+
+    def add_input(self, nbytes):
+        with self._lock:
+            self.input_bytes += nbytes
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def finish(self):
+        if self.finished:
+            return
+        self.finished = True
+        elapsed = time.perf_counter() - self.start
+        rss = worker_rss()
+        route = {'route': self.route}
+        observations = [('pdf2jpg_request_seconds', dict(route, cache=self.cache), elapsed),
+                        ('pdf2jpg_input_bytes', route, self.input_bytes),
+                        ('pdf2jpg_output_bytes', route, self.output_bytes),
+                        ('pdf2jpg_rss_bytes', route, rss)]
+        observations += [('pdf2jpg_stage_seconds', dict(route, stage=stage), seconds)
+                         for stage, seconds in self.stages.items()]
+        if self.pages:
+            observations.append(('pdf2jpg_pages', route, self.pages))
+        try:
+            metrics_store.observe(observations)
+        except sqlite3.Error:
+            app.logger.exception("Failed to record metrics.")
+        if PERF_LOG:
+            app.logger.info(json.dumps({
+                'event': 'conversion', 'route': self.route, 'cache': self.cache,
+                'seconds': round(elapsed, 4), 'stages': {k: round(v, 4) for k, v in self.stages.items()},
+                'pages': self.pages, 'input_bytes': self.input_bytes, 'output_bytes': self.output_bytes,
+                'rss_bytes': rss,
+            }))
+
+
+@app.route('/metrics')
+def metrics():
+    lines = metrics_store.render()
+    stats = conversion_cache.stats()
+    for name, kind, help_text in (('hits', 'counter', 'Conversion cache hits.'),
+                                  ('misses', 'counter', 'Conversion cache misses.'),
+                                  ('hit_bytes', 'counter', 'Bytes served from the conversion cache.'),
+                                  ('evictions', 'counter', 'Conversion cache evictions.'),
+                                  ('entries', 'gauge', 'Entries in the conversion cache.'),
+                                  ('bytes', 'gauge', 'Bytes stored in the conversion cache.')):
+        metric = f"pdf2jpg_cache_{name}_total" if kind == 'counter' else f"pdf2jpg_cache_{name}"
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} {kind}", f"{metric} {stats[name]}"]
+    return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+# Threads for the decode/resize stage of /jpg-to-pdf; PIL releases the GIL
+# while decoding and resampling, so multi-file uploads use several cores.
+JPG_DECODE_WORKERS = int(os.environ.get('JPG_DECODE_WORKERS', min(4, os.cpu_count() or 1)))
+_decode_pool = ThreadPoolExecutor(max_workers=JPG_DECODE_WORKERS)
+
+
+class PdfPageWriter:
+    # Minimal PDF writer that appends one image page at a time, so a merged
+    # document never holds more than the current page in memory. Page images
+    # are embedded as JPEG (DCTDecode) data without re-encoding.
+    def __init__(self, fp, page_width, page_height):
+        self.fp = fp
+        self.page_width = page_width
+        self.page_height = page_height
+        self.offsets = {}
+        self.page_ids = []
+        self.pos = 0
+        self._write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    def _write(self, data):
+        self.fp.write(data)
+        self.pos += len(data)
+
+    def _object(self, obj_id, body, stream=None):
+        self.offsets[obj_id] = self.pos
+        self._write(f"{obj_id} 0 obj\n".encode() + body)
+        if stream is not None:
+            self._write(b'\nstream\n')
+            self._write(stream)
+            self._write(b'\nendstream')
+        self._write(b'\nendobj\n')
+
+    def add_jpeg(self, data, width, height, mode):
+        # Objects 1 and 2 (catalog and page tree) are written by close()
+        image_id = 3 + 3 * len(self.page_ids)
+        content_id, page_id = image_id + 1, image_id + 2
+
+        # Fit and centre the image on the page, as the old canvas paste did
+        ratio = min(self.page_width / width, self.page_height / height)
+        w, h = int(width * ratio), int(height * ratio)
+        x = (self.page_width - w) // 2
+        y = self.page_height - (self.page_height - h) // 2 - h
+
+        colorspace = '/DeviceGray' if mode == 'L' else '/DeviceRGB'
+        self._object(image_id, (f"<< /Type /XObject /Subtype /Image /Width {width} /Height {height} "
+                                f"/ColorSpace {colorspace} /BitsPerComponent 8 /Filter /DCTDecode "
+                                f"/Length {len(data)} >>").encode(), data)
+        content = f"q {w} 0 0 {h} {x} {y} cm /Im0 Do Q".encode()
+        self._object(content_id, f"<< /Length {len(content)} >>".encode(), content)
+        self._object(page_id, (f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {self.page_width} {self.page_height}] "
+                               f"/Resources << /XObject << /Im0 {image_id} 0 R >> >> "
+                               f"/Contents {content_id} 0 R >>").encode())
+        self.page_ids.append(page_id)
+
+    def close(self):
+        kids = ' '.join(f"{page_id} 0 R" for page_id in self.page_ids)
+        self._object(2, f"<< /Type /Pages /Kids [{kids}] /Count {len(self.page_ids)} >>".encode())
+        self._object(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        xref = self.pos
+        size = max(self.offsets) + 1
+        lines = [f"xref\n0 {size}\n".encode(), b'0000000000 65535 f \n']
+        lines += [f"{self.offsets[obj_id]:010d} 00000 n \n".encode() for obj_id in range(1, size)]
+        self._write(b''.join(lines))
+        self._write(f"trailer\n<< /Size {size} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+
+
+def prepare_page(data, max_width, max_height, timer):
+    # Returns (jpeg_bytes, width, height, mode) for one uploaded image,
+    # scaled down to fit the page but never up (the PDF viewer does that)
+    timer.add_input(len(data))
+    with timer.stage('decode'):
+        img = Image.open(io.BytesIO(data))
+        ratio = min(max_width / img.width, max_height / img.height)
+        new_size = (int(img.width * ratio), int(img.height * ratio))
+        if img.format == 'JPEG' and img.mode in ('RGB', 'L'):
+            if ratio >= 1:
+                return data, img.width, img.height, img.mode
+            # Let libjpeg decode at 1/2, 1/4 or 1/8 scale instead of full size
+            img.draft(img.mode, new_size)
+        img.load()
+    with timer.stage('resize'):
+        if img.mode not in ('RGB', 'L'):
+            img = img.convert('RGB')
+        if ratio < 1:
+            img = img.resize(new_size, Image.LANCZOS)
+    with timer.stage('encode'):
+        out = io.BytesIO()
+        img.save(out, format='JPEG')
+    return out.getvalue(), img.width, img.height, img.mode
+
+
+def prepare_pages(files, max_width, max_height, timer):
+    # Decode/resize a bounded window of uploads in parallel, yielding in order
+    pending = collections.deque()
+    for file in files:
+        if len(pending) >= 2 * JPG_DECODE_WORKERS:
+            yield pending.popleft().result()
+        pending.append(_decode_pool.submit(lambda f=file: prepare_page(f.stream.read(), max_width, max_height, timer)))
+    while pending:
+        yield pending.popleft().result()
+
+
 @app.route('/jpg-to-pdf', methods=['GET', 'POST'])
 def jpg_to_pdf():
     if request.method == 'POST':
+        timer = RequestMetrics('jpg_to_pdf')
         if 'images' not in request.files:
             return jsonify(error="No file part"), 400
 
@@ -105,82 +718,693 @@ def jpg_to_pdf():
         if not files:
             return jsonify(error="No files uploaded"), 400
 
+        timer.add('upload', time.perf_counter() - timer.start)
+
         # US Letter size at 150dpi: 1275 x 1650 pixels (8.5 x 11 inches)
         base_width, base_height = 1275, 1650  # US Letter at 150dpi (8.5 x 11 inches)
-        images = []
-        for file in files:
-            original = Image.open(file.stream).convert('RGB')
-            base_width, base_height = 1275, 1650  # US Letter at 150dpi
-            canvas = Image.new('RGB', (base_width, base_height), 'white')
+        with timer.stage('cache_key'):
+            cache_key = ConversionCache.key_for([f.stream for f in files], route='jpg-to-pdf',
+                                                page_size=[base_width, base_height])
+        cached = conversion_cache.open(cache_key)
+        if cached is not None:
+            timer.cache = 'hit'
+            timer.input_bytes = sum(f.stream.seek(0, os.SEEK_END) for f in files)
+            timer.output_bytes = os.fstat(cached.fileno()).st_size
+            timer.finish()
+            return send_file(cached, mimetype='application/pdf', as_attachment=True, download_name='merged.pdf')
 
-            ratio = min(base_width / original.width, base_height / original.height)
-            new_size = (int(original.width * ratio), int(original.height * ratio))
-            resized = original.resize(new_size, Image.LANCZOS)
+        entry = conversion_cache.entry(cache_key)
+        try:
+            pdf = PdfPageWriter(entry.file, base_width, base_height)
+            for page in prepare_pages(files, base_width, base_height, timer):
+                with timer.stage('pdf_write'):
+                    pdf.add_jpeg(*page)
+            if not pdf.page_ids:
+                entry.discard()
+                return jsonify(error="No valid images"), 400
+            with timer.stage('pdf_write'):
+                pdf.close()
+        except BaseException:
+            entry.discard()
+            raise
 
-            offset = ((base_width - new_size[0]) // 2, (base_height - new_size[1]) // 2)
-            canvas.paste(resized, offset)
-            images.append(canvas)
+        # Open before publishing so a concurrent eviction cannot pull the file away
+        output_pdf = open(entry.tmp_path, 'rb')
+        entry.commit()
+        timer.pages = len(pdf.page_ids)
+        timer.output_bytes = pdf.pos
+        timer.finish()
+        return send_file(output_pdf, mimetype='application/pdf', as_attachment=True, download_name='merged.pdf')
 
-        if not images:
-            return jsonify(error="No valid images"), 400
+    return serve_precomputed('jpg_to_pdf.html', lambda: render_template('jpg_to_pdf.html'), 'text/html')
 
-        output_pdf = io.BytesIO()
-        images[0].save(output_pdf, format='PDF', save_all=True, append_images=images[1:])
-        output_pdf.seek(0)
+# Rendering slots shared by every worker on the box, one pdftoppm each
+RENDER_SLOTS = int(os.environ.get('RENDER_SLOTS', os.cpu_count() or 1))
+RENDER_LOCK_DIR = os.environ.get('RENDER_LOCK_DIR', os.path.join(tempfile.gettempdir(), 'pdf2jpg-slots'))
+# How long a synchronous request waits for a slot before giving up with 503
+RENDER_ADMISSION_TIMEOUT = float(os.environ.get('RENDER_ADMISSION_TIMEOUT', 30))
 
-        return send_file(output_pdf, mimetype='application/pdf', as_attachment=True, download_name='merged.pdf')
 
-    return render_template('jpg_to_pdf.html')
+class ZipStream(io.RawIOBase):
+    # Write-only sink for ZipFile; zipfile falls back to data descriptors
+    # because tell()/seek() are unsupported, so entries never need rewinding.
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class RenderScheduler:
+    # Admission control across gunicorn workers: a slot is an flock on one of
+    # `slots` files, so the cap holds for the whole server, not per process.
+    def __init__(self, lock_dir, slots, poll_interval=0.05):
+        self.lock_dir = lock_dir
+        self.slots = max(1, slots)
+        self.poll_interval = poll_interval
+        os.makedirs(lock_dir, exist_ok=True)
+
+    def acquire(self, timeout=None, on_wait=None):
+        # Raises TimeoutError if no slot frees up within `timeout` seconds;
+        # on_wait() is called between polls
+        deadline = None if timeout is None else time.monotonic() + timeout
+        start = random.randrange(self.slots)
+        while True:
+            for i in range(self.slots):
+                path = os.path.join(self.lock_dir, f"slot-{(start + i) % self.slots}")
+                fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    return fd
+                except BlockingIOError:
+                    os.close(fd)
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError("No render slot became free in time.")
+            if on_wait is not None:
+                on_wait()
+            time.sleep(self.poll_interval)
+
+    def release(self, fd):
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+render_scheduler = RenderScheduler(RENDER_LOCK_DIR, RENDER_SLOTS)
+_render_pool = None
+_render_pool_lock = threading.Lock()
+
+
+def get_render_pool():
+    # Created lazily so each gunicorn worker forks its own pool after startup
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is None:
+            _render_pool = ProcessPoolExecutor(max_workers=render_scheduler.slots)
+        return _render_pool
+
+
+def discard_render_pool(pool):
+    # A pool child that dies (e.g. OOM-killed) breaks the executor for good;
+    # drop it so the next get_render_pool() starts a fresh one
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is pool:
+            _render_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+# User-selectable render options for /convert and /convert/jobs
+DEFAULT_DPI = 150
+MIN_DPI, MAX_DPI = 36, 300
+DEFAULT_QUALITY = 75
+
+
+def conversion_options(form):
+    # Unknown or malformed values fall back to the defaults, as format always has
+    fmt = form.get('format', 'jpg').lower()
+    if fmt not in ('jpg', 'png'):
+        fmt = 'jpg'
+    dpi = min(max(form.get('dpi', DEFAULT_DPI, type=int), MIN_DPI), MAX_DPI)
+    quality = min(max(form.get('quality', DEFAULT_QUALITY, type=int), 1), 95)
+    pages = form.get('pages', '').replace(' ', '')
+    return fmt, dpi, quality, pages
+
+
+def parse_page_range(spec, page_count):
+    # "1-3,7,10-" -> sorted page numbers within the document, None if malformed
+    if not spec:
+        return list(range(1, page_count + 1))
+    pages = set()
+    for part in spec.split(','):
+        if not part:
+            continue
+        start, sep, end = part.partition('-')
+        try:
+            first = int(start) if start else 1
+            last = (int(end) if end else page_count) if sep else first
+        except ValueError:
+            return None
+        if first < 1 or last < first:
+            return None
+        pages.update(range(first, min(last, page_count) + 1))
+    return sorted(pages)
+
+
+def format_page_range(pages):
+    # Inverse of parse_page_range: [1, 2, 3, 7] -> "1-3,7"
+    runs = []
+    for page in pages:
+        if runs and page == runs[-1][1] + 1:
+            runs[-1][1] = page
+        else:
+            runs.append([page, page])
+    return ','.join(str(first) if first == last else f"{first}-{last}" for first, last in runs)
+
+
+def conversion_cache_key(stream, fmt, dpi, quality, pages):
+    # Keyed on what actually shapes the ZIP: the parsed page list, so "1-3"
+    # and "1,2,3" share an entry, and quality only where JPEG uses it
+    params = {'route': 'convert', 'format': fmt, 'dpi': dpi, 'pages': format_page_range(pages)}
+    if fmt == 'jpg':
+        params['quality'] = quality
+    return ConversionCache.key_for([stream], **params)
+
+
+def page_chunks(pages):
+    # Contiguous runs of at most PAGE_WINDOW pages, as (first, last)
+    chunk = []
+    for page in pages:
+        if chunk and (page != chunk[-1] + 1 or len(chunk) == PAGE_WINDOW):
+            yield chunk[0], chunk[-1]
+            chunk = []
+        chunk.append(page)
+    if chunk:
+        yield chunk[0], chunk[-1]
+
+
+def render_chunk(pdf_path, out_dir, fmt, dpi, quality, first, last):
+    # Runs in a pool process: pdftocairo writes the encoded pages first..last
+    # into out_dir itself, so no pixel data passes through PIL.
+    # Returns (seconds, [(page_number, path), ...]).
+    start = time.perf_counter()
+    paths = convert_from_path(pdf_path, dpi=dpi, first_page=first, last_page=last,
+                             fmt='jpeg' if fmt == 'jpg' else 'png', jpegopt={'quality': quality},
+                             use_pdftocairo=True, output_folder=out_dir,
+                             output_file=f"chunk{first:06d}-", paths_only=True)
+    # pdf2image ignores pdftocairo's exit status and lists whatever landed in
+    # out_dir, so a crashed or killed render shows up only as missing files.
+    # pdftocairo names each file <prefix>-<page>.<ext>.
+    rendered = sorted((int(os.path.splitext(path)[0].rsplit('-', 1)[1]), path) for path in paths)
+    if [page for page, _ in rendered] != list(range(first, last + 1)):
+        raise RuntimeError(f"pdftocairo rendered {len(rendered)} of pages {first}-{last}.")
+    return time.perf_counter() - start, rendered
+
+
+def render_pages(pdf_path, out_dir, fmt, dpi, quality, pages, timer, admission_timeout=None, heartbeat=None):
+    # Yields (page_number, path) in page order while up to RENDER_SLOTS
+    # chunks of this document render in parallel. heartbeat(), if given, is
+    # called about once a second while waiting for a slot or a slow chunk.
+    pool = get_render_pool()
+    pending = collections.deque()
+
+    def collect():
+        future = pending.popleft()
+        if heartbeat is not None:
+            while not wait_futures([future], timeout=1).done:
+                heartbeat()
+        seconds, rendered = future.result()
+        timer.add('render', seconds)
+        return rendered
+
+    try:
+        for first, last in page_chunks(pages):
+            if len(pending) >= render_scheduler.slots:
+                yield from collect()
+            with timer.stage('admission'):
+                slot = render_scheduler.acquire(admission_timeout, heartbeat)
+            try:
+                future = pool.submit(render_chunk, pdf_path, out_dir, fmt, dpi, quality, first, last)
+            except BaseException:
+                render_scheduler.release(slot)
+                raise
+            future.add_done_callback(lambda f, slot=slot: render_scheduler.release(slot))
+            pending.append(future)
+        while pending:
+            yield from collect()
+    except BrokenProcessPool:
+        discard_render_pool(pool)
+        raise
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def stream_zip(pdf_path, out_dir, fmt, dpi, quality, pages, timer, on_page=None, admission_timeout=None,
+               heartbeat=None):
+    sink = ZipStream()
+    rendered = render_pages(pdf_path, out_dir, fmt, dpi, quality, pages, timer, admission_timeout, heartbeat)
+    with zipfile.ZipFile(sink, 'w') as zipf:
+        for done, (page_number, path) in enumerate(rendered, 1):
+            with timer.stage('zip'):
+                zipf.write(path, f"page_{page_number}.{fmt}")
+                os.remove(path)
+            timer.pages = done
+            if on_page is not None:
+                on_page(done)
+            data = sink.drain()
+            timer.output_bytes += len(data)
+            yield data
+    data = sink.drain()
+    timer.output_bytes += len(data)
+    yield data
+
+
+def prepend(first, rest):
+    try:
+        yield first
+        yield from rest
+    finally:
+        rest.close()
+
 
 @app.route('/convert', methods=['POST'])
 def convert():
+    # Start timing before touching request.files, which reads the upload
+    timer = RequestMetrics('convert')
     if 'pdf' not in request.files:
         return "No file part in the request.", 400
     pdf_file = request.files['pdf']
     if pdf_file.filename == '':
         return "No selected file.", 400
-    # Get format from form, default to jpg
-    fmt = request.form.get('format', 'jpg').lower()
-    if fmt not in ('jpg', 'png'):
-        fmt = 'jpg'
-    images = convert_from_bytes(pdf_file.read(), dpi=150)
-    zip_buffer = io.BytesIO()
-    with zipfile.ZipFile(zip_buffer, 'w') as zipf:
-        for i, img in enumerate(images):
-            img_io = io.BytesIO()
-            img.save(img_io, format='JPEG' if fmt == 'jpg' else 'PNG')
-            img_io.seek(0)
-            ext = 'jpg' if fmt == 'jpg' else 'png'
-            zipf.writestr(f"page_{i+1}.{ext}", img_io.read())
-    zip_buffer.seek(0)
-    return send_file(zip_buffer, mimetype='application/zip', as_attachment=True, download_name='converted_images.zip')
+    # Get format, dpi, quality and page range from form, with defaults
+    fmt, dpi, quality, page_spec = conversion_options(request.form)
 
+    # Spool the upload to a per-request directory; poppler renders into it too
+    work_dir = tempfile.mkdtemp(prefix='pdf2jpg-')
+    pdf_path = os.path.join(work_dir, 'input.pdf')
+    with open(pdf_path, 'wb') as f:
+        shutil.copyfileobj(pdf_file.stream, f, STREAM_CHUNK_SIZE)
+        timer.input_bytes = f.tell()
+    timer.add('upload', time.perf_counter() - timer.start)
+    try:
+        page_count = pdfinfo_from_path(pdf_path)['Pages']
+    except (PDFPageCountError, PDFSyntaxError):
+        shutil.rmtree(work_dir, ignore_errors=True)
+        return "Invalid PDF file.", 400
+    pages = parse_page_range(page_spec, page_count)
+    if not pages:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        return "Invalid page range.", 400
 
-@app.route('/rate', methods=['GET', 'POST'])
-def rate():
-    from datetime import datetime
-    ratings_file = 'ratings.json'
-    vote_log_file = 'vote_log.json'
+    with timer.stage('cache_key'), open(pdf_path, 'rb') as f:
+        cache_key = conversion_cache_key(f, fmt, dpi, quality, pages)
+    cached = conversion_cache.open(cache_key)
+    if cached is not None:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        timer.cache = 'hit'
+        timer.output_bytes = os.fstat(cached.fileno()).st_size
+        timer.finish()
+        return send_file(cached, mimetype='application/zip', as_attachment=True,
+                         download_name='converted_images.zip')
+
+    chunks = cache_stream(stream_zip(pdf_path, work_dir, fmt, dpi, quality, pages, timer,
+                                     admission_timeout=RENDER_ADMISSION_TIMEOUT),
+                          conversion_cache, cache_key)
+    # Render the first chunk before answering so a full server is a 503, not a broken download
+    try:
+        first_chunk = next(chunks)
+    except TimeoutError:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        return "The server is busy, please try again shortly.", 503
+    except BaseException:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        raise
+    response = Response(prepend(first_chunk, chunks), mimetype='application/zip')
+    response.headers['Content-Disposition'] = 'attachment; filename=converted_images.zip'
+    response.call_on_close(lambda: shutil.rmtree(work_dir, ignore_errors=True))
+    response.call_on_close(timer.finish)
+    return response
+
+
+# Background conversion jobs for PDFs too large for the synchronous route.
+# The queue is a SQLite table next to the uploads, so any worker on the box
+# can pick up a job without an external broker.
+JOBS_DIR = os.environ.get('JOBS_DIR', os.path.join(tempfile.gettempdir(), 'pdf2jpg-jobs'))
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+JOB_TTL = int(os.environ.get('JOB_TTL', 60 * 60))
+# A running job not updated for this long is assumed orphaned and requeued
+JOB_STALE_AFTER = int(os.environ.get('JOB_STALE_AFTER', 10 * 60))
+# Running jobs touch their row at least this often, even while waiting
+JOB_HEARTBEAT_INTERVAL = 30
+
+
+class JobReclaimed(Exception):
+    # Raised in a worker whose claim on a job was handed to another worker
+    pass
+
+
+class JobQueue:
+    def __init__(self, root, ttl, stale_after):
+        self.root = root
+        self.ttl = ttl
+        self.stale_after = stale_after
+        os.makedirs(root, exist_ok=True)
+        self.db_path = os.path.join(root, 'jobs.sqlite3')
+        sqlite_enable_wal(self.db_path)
+        with sqlite_transaction(self.db_path) as db:
+            db.execute('CREATE TABLE IF NOT EXISTS jobs ('
+                       'id TEXT PRIMARY KEY, state TEXT NOT NULL, format TEXT NOT NULL, dpi INTEGER NOT NULL, '
+                       f"quality INTEGER NOT NULL DEFAULT {DEFAULT_QUALITY}, pages TEXT NOT NULL DEFAULT '', "
+                       'pages_done INTEGER NOT NULL DEFAULT 0, pages_total INTEGER NOT NULL, error TEXT, '
+                       'attempt INTEGER NOT NULL DEFAULT 0, '
+                       'created REAL NOT NULL, updated REAL NOT NULL, finished REAL)')
+            db.execute('CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, created)')
+            # Queues created before render options existed
+            columns = {row[1] for row in db.execute('PRAGMA table_info(jobs)')}
+            if 'quality' not in columns:
+                db.execute(f'ALTER TABLE jobs ADD COLUMN quality INTEGER NOT NULL DEFAULT {DEFAULT_QUALITY}')
+            if 'pages' not in columns:
+                db.execute("ALTER TABLE jobs ADD COLUMN pages TEXT NOT NULL DEFAULT ''")
+            if 'attempt' not in columns:
+                db.execute('ALTER TABLE jobs ADD COLUMN attempt INTEGER NOT NULL DEFAULT 0')
 
-    if not os.path.exists(ratings_file):
-        with open(ratings_file, 'w') as f:
-            json.dump({"summary": {"total_votes": 0, "total_score": 0}}, f)
+    def pdf_path(self, job_id):
+        return os.path.join(self.root, f"{job_id}.pdf")
 
-    if not os.path.exists(vote_log_file):
-        with open(vote_log_file, 'w') as f:
-            json.dump({}, f)
+    def zip_path(self, job_id):
+        return os.path.join(self.root, f"{job_id}.zip")
 
-    with open(ratings_file, 'r') as f:
-        data = json.load(f)
-        summary = data.get("summary", {"total_votes": 0, "total_score": 0})
+    def part_path(self, job_id, attempt):
+        # Per attempt, so a stale worker never writes into its successor's file
+        return os.path.join(self.root, f"{job_id}.{attempt}.zip.part")
 
-    with open(vote_log_file, 'r') as f:
-        vote_log = json.load(f)
+    def submit(self, job_id, fmt, dpi, quality, pages, pages_total):
+        now = time.time()
+        with sqlite_transaction(self.db_path) as db:
+            db.execute('INSERT INTO jobs (id, state, format, dpi, quality, pages, pages_total, created, updated) '
+                       "VALUES (?, 'queued', ?, ?, ?, ?, ?, ?, ?)",
+                       (job_id, fmt, dpi, quality, pages, pages_total, now, now))
 
-    client_ip = request.remote_addr
-    today = datetime.utcnow().strftime('%Y-%m-%d')
+    def get(self, job_id):
+        with sqlite_transaction(self.db_path) as db:
+            row = db.execute('SELECT id, state, format, dpi, quality, pages, pages_done, pages_total, error '
+                             'FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(('id', 'state', 'format', 'dpi', 'quality', 'pages', 'pages_done', 'pages_total', 'error'),
+                        row))
+
+    def claim(self):
+        # Each claim bumps `attempt`; progress() and finish() only apply to
+        # the latest attempt, so a requeued job has exactly one owner
+        now = time.time()
+        with sqlite_transaction(self.db_path) as db:
+            row = db.execute("SELECT id, attempt FROM jobs WHERE state = 'queued' "
+                             "OR (state = 'running' AND updated < ?) ORDER BY created LIMIT 1",
+                             (now - self.stale_after,)).fetchone()
+            if row is None:
+                return None
+            job_id, attempt = row[0], row[1] + 1
+            db.execute("UPDATE jobs SET state = 'running', pages_done = 0, attempt = ?, updated = ? WHERE id = ?",
+                       (attempt, now, job_id))
+        return dict(self.get(job_id), attempt=attempt)
+
+    def progress(self, job_id, attempt, pages_done=None):
+        # Heartbeat, optionally with progress; False once the claim is lost
+        with sqlite_transaction(self.db_path) as db:
+            cursor = db.execute("UPDATE jobs SET pages_done = COALESCE(?, pages_done), updated = ? "
+                                "WHERE id = ? AND attempt = ? AND state = 'running'",
+                                (pages_done, time.time(), job_id, attempt))
+        return cursor.rowcount == 1
+
+    def finish(self, job_id, attempt, error=None):
+        now = time.time()
+        with sqlite_transaction(self.db_path) as db:
+            cursor = db.execute("UPDATE jobs SET state = ?, error = ?, updated = ?, finished = ? "
+                                "WHERE id = ? AND attempt = ? AND state = 'running'",
+                                ('failed' if error else 'done', error, now, now, job_id, attempt))
+        if cursor.rowcount != 1:
+            return False
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self.pdf_path(job_id))
+        return True
+
+    def expire(self):
+        # Finished jobs and their results are kept for `ttl` seconds
+        with sqlite_transaction(self.db_path) as db:
+            expired = [job_id for (job_id,) in db.execute('SELECT id FROM jobs WHERE finished < ?',
+                                                          (time.time() - self.ttl,))]
+            db.executemany('DELETE FROM jobs WHERE id = ?', [(job_id,) for job_id in expired])
+        for job_id in expired:
+            paths = [self.pdf_path(job_id), self.zip_path(job_id)]
+            paths += glob.glob(os.path.join(self.root, f"{job_id}.*.zip.part"))
+            for path in paths:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(path)
+
+
+job_queue = JobQueue(JOBS_DIR, JOB_TTL, JOB_STALE_AFTER)
+_job_workers_pid = None
+_job_workers_lock = threading.Lock()
+
+
+class JobClaim:
+    # One worker's attempt at a job. progress() raises JobReclaimed once
+    # another worker has taken the job over as stale.
+    def __init__(self, job):
+        self.job_id = job['id']
+        self.attempt = job['attempt']
+        self._last_beat = time.monotonic()
+
+    def progress(self, pages_done=None):
+        if not job_queue.progress(self.job_id, self.attempt, pages_done):
+            raise JobReclaimed(self.job_id)
+        self._last_beat = time.monotonic()
+
+    def heartbeat(self):
+        # Cheap to call often; only writes every JOB_HEARTBEAT_INTERVAL
+        if time.monotonic() - self._last_beat >= JOB_HEARTBEAT_INTERVAL:
+            self.progress()
+
+
+def run_job(job, claim):
+    job_id, fmt, dpi, quality = job['id'], job['format'], job['dpi'], job['quality']
+    pdf_path = job_queue.pdf_path(job_id)
+    timer = RequestMetrics('convert_job')
+    pages = parse_page_range(job['pages'], pdfinfo_from_path(pdf_path)['Pages'])
+    with timer.stage('cache_key'), open(pdf_path, 'rb') as f:
+        cache_key = conversion_cache_key(f, fmt, dpi, quality, pages)
+    tmp_path = job_queue.part_path(job_id, claim.attempt)
+    work_dir = tempfile.mkdtemp(prefix='pdf2jpg-', dir=job_queue.root)
+    timer.input_bytes = os.path.getsize(pdf_path)
+    cached = conversion_cache.open(cache_key)
+    try:
+        with open(tmp_path, 'wb') as out:
+            if cached is not None:
+                timer.cache = 'hit'
+                with cached:
+                    shutil.copyfileobj(cached, out, STREAM_CHUNK_SIZE)
+                claim.progress(job['pages_total'])
+            else:
+                chunks = stream_zip(pdf_path, work_dir, fmt, dpi, quality, pages, timer,
+                                    on_page=claim.progress, heartbeat=claim.heartbeat)
+                for chunk in cache_stream(chunks, conversion_cache, cache_key):
+                    out.write(chunk)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(tmp_path)
+        raise
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    try:
+        # Last check that this attempt still owns the job before publishing
+        claim.progress()
+    except JobReclaimed:
+        os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, job_queue.zip_path(job_id))
+    timer.output_bytes = os.path.getsize(job_queue.zip_path(job_id))
+    timer.finish()
+
+
+def job_worker():
+    last_expire = 0
+    while True:
+        try:
+            if time.time() - last_expire > 60:
+                job_queue.expire()
+                last_expire = time.time()
+            job = job_queue.claim()
+            if job is None:
+                time.sleep(1)
+                continue
+            try:
+                run_job(job, JobClaim(job))
+            except JobReclaimed:
+                app.logger.warning("Conversion job was requeued while running; dropping this attempt.")
+            except Exception:
+                app.logger.exception("Conversion job failed.")
+                job_queue.finish(job['id'], job['attempt'], error="Conversion failed.")
+            else:
+                job_queue.finish(job['id'], job['attempt'])
+        except Exception:
+            app.logger.exception("Job worker error.")
+            time.sleep(5)
+
+
+def ensure_job_workers():
+    # Started on first use in each gunicorn worker, after the fork
+    global _job_workers_pid
+    with _job_workers_lock:
+        if _job_workers_pid == os.getpid():
+            return
+        _job_workers_pid = os.getpid()
+        for _ in range(JOB_WORKERS):
+            threading.Thread(target=job_worker, daemon=True).start()
+
+
+def job_status(job):
+    return dict(job, status_url=f"/convert/jobs/{job['id']}",
+                download_url=f"/convert/jobs/{job['id']}/download")
+
+
+@app.route('/convert/jobs', methods=['POST'])
+def create_convert_job():
+    if 'pdf' not in request.files:
+        return jsonify(error="No file part in the request."), 400
+    pdf_file = request.files['pdf']
+    if pdf_file.filename == '':
+        return jsonify(error="No selected file."), 400
+    fmt, dpi, quality, page_spec = conversion_options(request.form)
+
+    job_id = uuid.uuid4().hex
+    pdf_path = job_queue.pdf_path(job_id)
+    with open(pdf_path, 'wb') as f:
+        shutil.copyfileobj(pdf_file.stream, f, STREAM_CHUNK_SIZE)
+    try:
+        page_count = pdfinfo_from_path(pdf_path)['Pages']
+    except (PDFPageCountError, PDFSyntaxError):
+        os.remove(pdf_path)
+        return jsonify(error="Invalid PDF file."), 400
+    pages = parse_page_range(page_spec, page_count)
+    if not pages:
+        os.remove(pdf_path)
+        return jsonify(error="Invalid page range."), 400
+
+    job_queue.submit(job_id, fmt, dpi, quality, page_spec, len(pages))
+    ensure_job_workers()
+    return jsonify(job_status(job_queue.get(job_id))), 202
+
+
+@app.route('/convert/jobs/<job_id>')
+def get_convert_job(job_id):
+    ensure_job_workers()
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify(error="Job not found."), 404
+    return jsonify(job_status(job))
+
+
+@app.route('/convert/jobs/<job_id>/download')
+def download_convert_job(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify(error="Job not found."), 404
+    if job['state'] != 'done':
+        return jsonify(error="Job is not finished.", state=job['state']), 409
+    return send_file(job_queue.zip_path(job_id), mimetype='application/zip', as_attachment=True,
+                     download_name='converted_images.zip')
+
+
+# Ratings live in SQLite so votes from every worker are atomic increments.
+# The aggregate is cached per process; votes cast in other workers show up
+# within RATINGS_CACHE_TTL seconds.
+RATINGS_DB = os.environ.get('RATINGS_DB', 'ratings.sqlite3')
+RATINGS_CACHE_TTL = 5
+
+
+class RatingStore:
+    def __init__(self, db_path, ratings_file, vote_log_file):
+        self.db_path = db_path
+        self._summary = None
+        self._loaded_at = 0
+        self._lock = threading.Lock()
+        sqlite_enable_wal(db_path)
+        with sqlite_transaction(db_path) as db:
+            db.execute('CREATE TABLE IF NOT EXISTS summary (id INTEGER PRIMARY KEY CHECK (id = 1), '
+                       'total_votes INTEGER NOT NULL, total_score INTEGER NOT NULL)')
+            db.execute('CREATE TABLE IF NOT EXISTS votes (ip TEXT NOT NULL, day TEXT NOT NULL, '
+                       'PRIMARY KEY (ip, day)) WITHOUT ROWID')
+            db.execute('CREATE INDEX IF NOT EXISTS votes_day ON votes (day)')
+            db.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL)')
+            if db.execute("SELECT 1 FROM meta WHERE name = 'migrated'").fetchone() is None:
+                self._migrate(db, ratings_file, vote_log_file)
+
+    @staticmethod
+    def _migrate(db, ratings_file, vote_log_file):
+        # One-time import of the old JSON files
+        summary = {"total_votes": 0, "total_score": 0}
+        if os.path.exists(ratings_file):
+            with open(ratings_file, 'r') as f:
+                summary.update(json.load(f).get("summary", {}))
+        db.execute('INSERT OR REPLACE INTO summary (id, total_votes, total_score) VALUES (1, ?, ?)',
+                   (summary["total_votes"], summary["total_score"]))
+        if os.path.exists(vote_log_file):
+            with open(vote_log_file, 'r') as f:
+                vote_log = json.load(f)
+            db.executemany('INSERT OR IGNORE INTO votes (ip, day) VALUES (?, ?)', vote_log.items())
+        db.execute("INSERT INTO meta (name, value) VALUES ('migrated', ?)", (str(time.time()),))
+
+    def _store(self, row):
+        self._summary = {"total_votes": row[0], "total_score": row[1]}
+        self._loaded_at = time.monotonic()
+        return self._summary
+
+    def summary(self):
+        with self._lock:
+            if self._summary is not None and time.monotonic() - self._loaded_at < RATINGS_CACHE_TTL:
+                return self._summary
+            with sqlite_read(self.db_path) as db:
+                row = db.execute('SELECT total_votes, total_score FROM summary WHERE id = 1').fetchone()
+            return self._store(row)
+
+    def has_voted(self, ip, day):
+        with sqlite_read(self.db_path) as db:
+            return db.execute('SELECT 1 FROM votes WHERE ip = ? AND day = ?', (ip, day)).fetchone() is not None
+
+    def vote(self, ip, day, rating):
+        # Returns the new summary, or None if this ip already voted on `day`
+        with self._lock, sqlite_transaction(self.db_path) as db:
+            # Only today's votes matter for the duplicate check
+            db.execute('DELETE FROM votes WHERE day < ?', (day,))
+            if db.execute('INSERT OR IGNORE INTO votes (ip, day) VALUES (?, ?)', (ip, day)).rowcount == 0:
+                return None
+            db.execute('UPDATE summary SET total_votes = total_votes + 1, total_score = total_score + ? '
+                       'WHERE id = 1', (rating,))
+            row = db.execute('SELECT total_votes, total_score FROM summary WHERE id = 1').fetchone()
+            return self._store(row)
+
+
+rating_store = RatingStore(RATINGS_DB, 'ratings.json', 'vote_log.json')
+
+
+@app.route('/rate', methods=['GET', 'POST'])
+def rate():
+    from datetime import datetime
+    summary = rating_store.summary()
 
     if request.method == 'POST':
+        client_ip = request.remote_addr
+        today = datetime.utcnow().strftime('%Y-%m-%d')
         lang = request.cookies.get("pdf2jpg_lang") or request.args.get("lang", "en")
         messages = {
             "en": "You have already voted today.",
@@ -190,7 +1414,7 @@ def rate():
             "ja": "今日はすでに投票済みです。",
             "zh": "您今天已经投过票了。"
         }
-        if vote_log.get(client_ip) == today:
+        if rating_store.has_voted(client_ip, today):
             app.logger.info("Duplicate vote attempt detected (IP suppressed).")
             return jsonify(error=messages.get(lang, messages["en"])), 403
 
@@ -199,14 +1423,10 @@ def rate():
         if not (1 <= rating <= 5):
             return jsonify(error="Invalid rating"), 400
 
-        summary["total_votes"] += 1
-        summary["total_score"] += rating
-        vote_log[client_ip] = today
-
-        with open(ratings_file, 'w') as f:
-            json.dump({"summary": summary}, f)
-        with open(vote_log_file, 'w') as f:
-            json.dump(vote_log, f)
+        summary = rating_store.vote(client_ip, today, rating)
+        if summary is None:
+            app.logger.info("Duplicate vote attempt detected (IP suppressed).")
+            return jsonify(error=messages.get(lang, messages["en"])), 403
 
     average = summary["total_score"] / summary["total_votes"] if summary["total_votes"] else 0
     return jsonify(average=average, count=summary["total_votes"])
@@ -221,21 +1441,17 @@ def handle_403(e):
 def handle_400(e):
     return jsonify(error="Bad Request"), 400
 
-from flask import send_from_directory
-
-
 @app.route('/favicon.ico')
 def favicon():
-    return send_from_directory(os.path.join(app.root_path, 'static'),
-                               'favicon.png', mimetype='image/png')
+    return static_file('favicon.png')
 
 @app.route('/robots.txt')
 def robots_txt():
-    return send_from_directory('static', 'robots.txt')
+    return static_file('robots.txt')
 
 @app.route('/ads.txt')
 def ads_txt():
-    return send_from_directory('static', 'ads.txt')
+    return static_file('ads.txt')
 
 # Run the app
 if __name__ == '__main__':
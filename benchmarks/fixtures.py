@@ -0,0 +1,133 @@
+"""Deterministic synthetic inputs for the benchmarks.
+
+PDFs are written with a tiny standalone writer so that 500-page documents
+can be produced without holding every page in memory. Everything is seeded,
+so the same arguments always produce the same bytes for a given Pillow.
+"""
+import io
+import os
+import random
+
+from PIL import Image, ImageDraw
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.fixtures')
+
+PAGE_WIDTH, PAGE_HEIGHT = 612, 792  # US Letter in points
+WORDS = ('lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore '
+         'et dolore magna aliqua invoice total page report summary quarterly revenue').split()
+
+# density -> text lines per page; "scan" pages are one full-page JPEG each
+PDF_DENSITIES = {'sparse': 4, 'text': 48, 'scan': 0}
+
+
+def photo(width, height, seed):
+    # Photo-like RGB image: smooth gradients, shapes and a noise texture
+    rng = random.Random(seed)
+    gradient = Image.linear_gradient('L').resize((width, height))
+    base = Image.merge('RGB', (gradient, gradient.rotate(90).resize((width, height)),
+                               Image.new('L', (width, height), rng.randrange(256))))
+    draw = ImageDraw.Draw(base)
+    for _ in range(40):
+        x, y = rng.randrange(width), rng.randrange(height)
+        r = rng.randrange(max(width, height) // 40 + 1, max(width, height) // 6 + 2)
+        draw.ellipse((x - r, y - r, x + r, y + r),
+                     fill=(rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    noise = Image.frombytes('RGB', (256, 256), rng.randbytes(256 * 256 * 3)).resize((width, height), Image.BICUBIC)
+    return Image.blend(base, noise, 0.25)
+
+
+def jpeg_bytes(width, height, seed=0, quality=85):
+    out = io.BytesIO()
+    photo(width, height, seed).save(out, format='JPEG', quality=quality)
+    return out.getvalue()
+
+
+def _text_page(rng, lines):
+    ops = ['BT /F1 11 Tf 14 TL 54 740 Td']
+    for _ in range(lines):
+        text = ' '.join(rng.choice(WORDS) for _ in range(rng.randrange(6, 13)))
+        ops.append(f"({text}) Tj T*")
+    ops.append('ET')
+    # A few vector shapes so sparse pages are not entirely blank
+    for _ in range(3):
+        x, y = rng.randrange(54, 400), rng.randrange(54, 600)
+        ops.append(f"0.{rng.randrange(10)} g {x} {y} {rng.randrange(40, 150)} {rng.randrange(20, 80)} re f")
+    return '\n'.join(ops).encode('latin-1')
+
+
+def write_pdf(fp, pages, density, seed=0):
+    # Objects: 1 catalog, 2 page tree, 3 font, 4.. scan images, then
+    # (content, page) pairs for every page
+    rng = random.Random(f"{seed}-{pages}-{density}")
+    offsets = {}
+    pos = 0
+
+    def write(data):
+        nonlocal pos
+        fp.write(data)
+        pos += len(data)
+
+    def obj(obj_id, body, stream=None):
+        offsets[obj_id] = pos
+        write(f"{obj_id} 0 obj\n".encode() + body)
+        if stream is not None:
+            write(b'\nstream\n' + stream + b'\nendstream')
+        write(b'\nendobj\n')
+
+    write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+    obj(3, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>')
+    next_id = 4
+    scans = []
+    if density == 'scan':
+        # A handful of distinct 150 dpi scans, reused across pages
+        for i in range(min(pages, 4)):
+            data = jpeg_bytes(1275, 1650, seed=f"{seed}-scan-{i}", quality=75)
+            obj(next_id, (f"<< /Type /XObject /Subtype /Image /Width 1275 /Height 1650 /ColorSpace /DeviceRGB "
+                          f"/BitsPerComponent 8 /Filter /DCTDecode /Length {len(data)} >>").encode(), data)
+            scans.append(next_id)
+            next_id += 1
+
+    page_ids = []
+    for page in range(pages):
+        if scans:
+            image_id = scans[page % len(scans)]
+            content = f"q {PAGE_WIDTH} 0 0 {PAGE_HEIGHT} 0 0 cm /Im0 Do Q".encode()
+            resources = f"/XObject << /Im0 {image_id} 0 R >>"
+        else:
+            content = _text_page(rng, PDF_DENSITIES[density])
+            resources = '/Font << /F1 3 0 R >>'
+        obj(next_id, f"<< /Length {len(content)} >>".encode(), content)
+        obj(next_id + 1, (f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] "
+                          f"/Resources << {resources} >> /Contents {next_id} 0 R >>").encode())
+        page_ids.append(next_id + 1)
+        next_id += 2
+
+    kids = ' '.join(f"{page_id} 0 R" for page_id in page_ids)
+    obj(2, f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode())
+    obj(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+    xref = pos
+    size = max(offsets) + 1
+    write(f"xref\n0 {size}\n".encode() + b'0000000000 65535 f \n')
+    write(b''.join(f"{offsets[i]:010d} 00000 n \n".encode() for i in range(1, size)))
+    write(f"trailer\n<< /Size {size} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+
+
+def _cached(name, build):
+    os.makedirs(FIXTURE_DIR, exist_ok=True)
+    path = os.path.join(FIXTURE_DIR, name)
+    if not os.path.exists(path):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            build(f)
+        os.replace(tmp_path, path)
+    return path
+
+
+def pdf_fixture(pages, density, seed=0):
+    if density not in PDF_DENSITIES:
+        raise ValueError(f"Unknown density {density!r}")
+    return _cached(f"doc-{pages}p-{density}-{seed}.pdf", lambda f: write_pdf(f, pages, density, seed))
+
+
+def jpeg_fixture(width, height, seed=0):
+    return _cached(f"photo-{width}x{height}-{seed}.jpg", lambda f: f.write(jpeg_bytes(width, height, seed)))
@@ -0,0 +1,457 @@
+"""Offline benchmark and load test for the conversion endpoints.
+
+    python benchmarks/run.py                              # Flask test client, quick profile
+    python benchmarks/run.py --mode gunicorn --workers 4 --concurrency 8
+    python benchmarks/run.py --profile full --mode both
+    python benchmarks/run.py --update-baseline            # accept current numbers
+
+Fixtures are generated locally (see fixtures.py); nothing touches the
+network. Per scenario it reports p50/p95/p99 latency, throughput and the
+peak RSS of the serving process tree, writes them to --output, and exits
+with status 1 if any result regresses past --tolerance against --baseline.
+Absolute numbers only mean something on the machine that produced them, so
+--baseline holds one set of results per hardware (CPU model and count,
+architecture, Python version) and a run is only compared against its own.
+A scenario with no baseline entry also fails the run, as does skipping the
+/convert scenarios when poppler (pdftocairo) is not installed; pass
+--allow-missing-baseline to only warn about either. Record baselines on a
+machine with poppler so they cover /convert:
+
+    python benchmarks/run.py --mode both --update-baseline
+"""
+import argparse
+import http.client
+import io
+import json
+import os
+import platform
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+import fixtures
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+
+# (pages, density) for /convert and (images, width, height) for /jpg-to-pdf
+PROFILES = {
+    'quick': {
+        'convert': [(1, 'sparse'), (10, 'text'), (10, 'scan')],
+        'jpg_to_pdf': [(1, 1920, 1080), (5, 4000, 3000)],
+    },
+    'full': {
+        'convert': [(1, 'sparse'), (10, 'text'), (10, 'scan'), (100, 'text'), (100, 'scan'), (500, 'sparse'),
+                    (500, 'text')],
+        'jpg_to_pdf': [(1, 640, 480), (1, 1920, 1080), (5, 4000, 3000), (10, 4000, 3000), (20, 6000, 4000)],
+    },
+}
+
+
+@dataclass
+class Scenario:
+    name: str
+    method: str
+    path: str
+    form: dict = field(default_factory=dict)
+    files: list = field(default_factory=list)  # (field, filename, fixture path, content type)
+    json: dict = None
+    expect: tuple = (200,)
+    needs_poppler: bool = False
+
+
+def build_scenarios(profile, only=None):
+    scenarios = []
+    for pages, density in PROFILES[profile]['convert']:
+        scenarios.append(Scenario(f"convert_{pages}p_{density}", 'POST', '/convert', form={'format': 'jpg'},
+                                  files=[('pdf', 'bench.pdf', fixtures.pdf_fixture(pages, density),
+                                          'application/pdf')],
+                                  needs_poppler=True))
+    for count, width, height in PROFILES[profile]['jpg_to_pdf']:
+        files = [('images', f"photo{i}.jpg", fixtures.jpeg_fixture(width, height, seed=i), 'image/jpeg')
+                 for i in range(count)]
+        scenarios.append(Scenario(f"jpg_to_pdf_{count}x{width}x{height}", 'POST', '/jpg-to-pdf', files=files))
+    scenarios.append(Scenario('rate_get', 'GET', '/rate'))
+    # Behind gunicorn every request comes from 127.0.0.1, so all but the
+    # first vote take the duplicate-vote path
+    scenarios.append(Scenario('rate_post', 'POST', '/rate', json={'rating': 5}, expect=(200, 403)))
+    if only:
+        scenarios = [s for s in scenarios if any(s.name.startswith(prefix) for prefix in only)]
+    return scenarios
+
+
+def isolated_env(state_dir, keep_cache):
+    # Point every on-disk store of the app at a throwaway directory
+    env = {
+        'CACHE_DIR': os.path.join(state_dir, 'cache'),
+        'JOBS_DIR': os.path.join(state_dir, 'jobs'),
+        'METRICS_DB': os.path.join(state_dir, 'metrics.sqlite3'),
+        'RATINGS_DB': os.path.join(state_dir, 'ratings.sqlite3'),
+        'RENDER_LOCK_DIR': os.path.join(state_dir, 'slots'),
+    }
+    if not keep_cache:
+        # Every entry is evicted as soon as it is stored, so each request converts
+        env['CACHE_MAX_BYTES'] = '0'
+    return env
+
+
+def process_tree(pid):
+    # pid and all of its descendants, from /proc
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    tree, stack = [], [pid]
+    while stack:
+        current = stack.pop()
+        tree.append(current)
+        stack.extend(children.get(current, []))
+    return tree
+
+
+def reset_peak_rss(pids):
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/clear_refs", 'w') as f:
+                f.write('5')
+        except OSError:
+            pass
+
+
+def peak_rss(pids):
+    # Sum of VmHWM over the tree; short-lived poppler processes are not seen
+    total = 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith('VmHWM:'):
+                        total += int(line.split()[1]) * 1024
+        except OSError:
+            pass
+    return total
+
+
+def encode_multipart(form, files):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in form.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, filename, path, content_type in files:
+        with open(path, 'rb') as f:
+            data = f.read()
+        parts.append((f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                      f'Content-Type: {content_type}\r\n\r\n').encode() + data + b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+class TestClientDriver:
+    name = 'testclient'
+
+    def __init__(self, env):
+        os.environ.update(env)
+        sys.path.insert(0, REPO_DIR)
+        import app
+        self.app = app.app
+        self._local = threading.local()
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    def pids(self):
+        return process_tree(os.getpid())
+
+    def request(self, scenario):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        with self._lock:
+            self._counter += 1
+            # A distinct client address per request so votes are not duplicates
+            remote_addr = f"10.{self._counter >> 16 & 255}.{self._counter >> 8 & 255}.{self._counter & 255}"
+        kwargs = {'environ_base': {'REMOTE_ADDR': remote_addr}}
+        if scenario.files:
+            data = dict(scenario.form)
+            for name, filename, path, content_type in scenario.files:
+                with open(path, 'rb') as f:
+                    data.setdefault(name, []).append((io.BytesIO(f.read()), filename, content_type))
+            kwargs['data'] = data
+        elif scenario.json is not None:
+            kwargs['json'] = scenario.json
+        response = client.open(scenario.path, method=scenario.method, **kwargs)
+        size = len(response.get_data())
+        response.close()
+        return response.status_code, size
+
+    def close(self):
+        pass
+
+
+class GunicornDriver:
+    name = 'gunicorn'
+
+    def __init__(self, env, workers, threads, timeout=300):
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            self.port = s.getsockname()[1]
+        self.timeout = timeout
+        self.proc = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '--chdir', REPO_DIR, '-w', str(workers), '--threads', str(threads),
+             '-t', str(timeout), '-b', f"127.0.0.1:{self.port}", 'app:app'],
+            env=dict(os.environ, **env), stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if self.proc.poll() is not None:
+                raise RuntimeError(f"gunicorn exited: {self.proc.stderr.read().decode(errors='replace')}")
+            try:
+                self.request(Scenario('probe', 'GET', '/rate'))
+                return
+            except OSError:
+                time.sleep(0.2)
+        self.close()
+        raise RuntimeError('gunicorn did not start within 30s')
+
+    def pids(self):
+        return process_tree(self.proc.pid)
+
+    def request(self, scenario):
+        headers = {}
+        body = None
+        if scenario.files:
+            body, headers['Content-Type'] = encode_multipart(scenario.form, scenario.files)
+        elif scenario.json is not None:
+            body = json.dumps(scenario.json).encode()
+            headers['Content-Type'] = 'application/json'
+        conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=self.timeout)
+        try:
+            conn.request(scenario.method, scenario.path, body=body, headers=headers)
+            response = conn.getresponse()
+            size = len(response.read())
+            return response.status, size
+        finally:
+            conn.close()
+
+    def close(self):
+        self.proc.terminate()
+        try:
+            self.proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+
+
+def percentile(sorted_values, q):
+    # Nearest-rank percentile
+    index = max(0, min(len(sorted_values) - 1, int(round(q / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def run_scenario(driver, scenario, requests, concurrency, warmup):
+    for _ in range(warmup):
+        driver.request(scenario)
+
+    pids = driver.pids()
+    reset_peak_rss(pids)
+    latencies = []
+    errors = 0
+    output_bytes = 0
+
+    def timed(_):
+        start = time.perf_counter()
+        try:
+            status, size = driver.request(scenario)
+        except OSError:
+            status, size = None, 0
+        return status, size, time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for status, size, latency in pool.map(timed, range(requests)):
+            latencies.append(latency)
+            output_bytes += size
+            if status not in scenario.expect:
+                errors += 1
+    wall = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'requests': requests,
+        'concurrency': concurrency,
+        'errors': errors,
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'p99': percentile(latencies, 99),
+        'mean': statistics.fmean(latencies),
+        'throughput_rps': requests / wall,
+        'output_bytes': output_bytes // requests,
+        'peak_rss_bytes': peak_rss(driver.pids() or pids),
+    }
+
+
+def hardware():
+    # What absolute latency, throughput and RSS depend on. Baselines are kept
+    # per hardware and only ever compared on an exact match.
+    cpu_model = platform.processor() or 'unknown'
+    try:
+        with open('/proc/cpuinfo') as f:
+            cpu_model = next(line.split(':', 1)[1].strip() for line in f if line.startswith('model name'))
+    except (OSError, StopIteration):
+        pass
+    return {
+        'system': platform.system(),
+        'machine': platform.machine(),
+        'cpu_model': cpu_model,
+        'cpu_count': os.cpu_count(),
+        'python': '.'.join(platform.python_version_tuple()[:2]),
+    }
+
+
+def hardware_key(hw):
+    return f"{hw['system']}-{hw['machine']} {hw['cpu_count']}x {hw['cpu_model']} python{hw['python']}"
+
+
+def compare(results, baseline, tolerance, min_delta):
+    regressions = []
+    for key, current in results.items():
+        reference = baseline.get(key)
+        if reference is None:
+            continue
+        for metric in ('p50', 'p95', 'p99'):
+            if current[metric] > reference[metric] * (1 + tolerance) and \
+                    current[metric] - reference[metric] > min_delta:
+                regressions.append(f"{key}: {metric} {current[metric] * 1000:.1f}ms "
+                                   f"> baseline {reference[metric] * 1000:.1f}ms")
+        if current['throughput_rps'] < reference['throughput_rps'] * (1 - tolerance):
+            regressions.append(f"{key}: throughput {current['throughput_rps']:.2f}/s "
+                               f"< baseline {reference['throughput_rps']:.2f}/s")
+        if current['peak_rss_bytes'] > reference['peak_rss_bytes'] * (1 + tolerance):
+            regressions.append(f"{key}: peak RSS {current['peak_rss_bytes'] >> 20}MB "
+                               f"> baseline {reference['peak_rss_bytes'] >> 20}MB")
+        if current['errors'] > reference['errors']:
+            regressions.append(f"{key}: {current['errors']} errors > baseline {reference['errors']}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', choices=('testclient', 'gunicorn', 'both'), default='testclient')
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='quick')
+    parser.add_argument('--only', action='append', help='run scenarios whose name starts with this prefix')
+    parser.add_argument('--requests', type=int, default=20, help='measured requests per scenario')
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn worker processes')
+    parser.add_argument('--threads', type=int, default=4, help='gunicorn threads per worker')
+    parser.add_argument('--cache', action='store_true', help='leave the conversion cache enabled')
+    parser.add_argument('--output', default=os.path.join(BENCH_DIR, 'results.json'))
+    parser.add_argument('--baseline', default=os.path.join(BENCH_DIR, 'baselines.json'))
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative regression')
+    parser.add_argument('--min-delta-ms', type=float, default=5.0,
+                        help='ignore latency regressions smaller than this')
+    parser.add_argument('--update-baseline', action='store_true', help='write results into the baseline file')
+    parser.add_argument('--allow-missing-baseline', action='store_true',
+                        help='warn instead of failing on scenarios without a baseline or skipped for lack of poppler')
+    args = parser.parse_args(argv)
+
+    scenarios = build_scenarios(args.profile, args.only)
+    skipped = []
+    if shutil.which('pdftocairo') is None:
+        skipped = [s.name for s in scenarios if s.needs_poppler]
+        if skipped:
+            print(f"pdftocairo not found, skipping: {', '.join(skipped)}", file=sys.stderr)
+        scenarios = [s for s in scenarios if not s.needs_poppler]
+
+    modes = ('testclient', 'gunicorn') if args.mode == 'both' else (args.mode,)
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='pdf2jpg-bench-') as state_dir:
+        for mode in modes:
+            env = isolated_env(os.path.join(state_dir, mode), args.cache)
+            if mode == 'testclient':
+                driver = TestClientDriver(env)
+            else:
+                driver = GunicornDriver(env, args.workers, args.threads)
+            try:
+                for scenario in scenarios:
+                    key = f"{mode}/{scenario.name}/c{args.concurrency}"
+                    result = run_scenario(driver, scenario, args.requests, args.concurrency, args.warmup)
+                    results[key] = result
+                    print(f"{key:50s} p50 {result['p50'] * 1000:9.1f}ms  p95 {result['p95'] * 1000:9.1f}ms  "
+                          f"p99 {result['p99'] * 1000:9.1f}ms  {result['throughput_rps']:8.2f}/s  "
+                          f"rss {result['peak_rss_bytes'] >> 20:6d}MB  errors {result['errors']}")
+            finally:
+                driver.close()
+
+    machine = hardware()
+    meta = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'hardware': machine,
+        'profile': args.profile,
+        'requests': args.requests,
+        'cache': args.cache,
+    }
+    with open(args.output, 'w') as f:
+        json.dump({'meta': meta, 'results': results}, f, indent=2, sort_keys=True)
+
+    # {"machines": {hardware_key: {"meta": ..., "results": ...}}}
+    machines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            machines = json.load(f).get('machines', {})
+    key = hardware_key(machine)
+    level = 'WARNING' if args.allow_missing_baseline else 'ERROR'
+
+    if args.update_baseline:
+        # A baseline without /convert would pass the gate while checking
+        # nothing for it, so record one only where poppler is installed
+        if skipped and not args.allow_missing_baseline:
+            print(f"ERROR not recording a baseline without: {', '.join(skipped)}; install poppler "
+                  f"or pass --allow-missing-baseline", file=sys.stderr)
+            return 1
+        baseline = machines.get(key, {}).get('results', {})
+        baseline.update(results)
+        machines[key] = {'meta': meta, 'results': baseline}
+        with open(args.baseline, 'w') as f:
+            json.dump({'machines': machines}, f, indent=2, sort_keys=True)
+        print(f"Baseline for {key} updated: {args.baseline}")
+        if skipped:
+            print(f"WARNING baseline still has no entries for: {', '.join(skipped)}", file=sys.stderr)
+        return 0
+
+    if key not in machines:
+        # Numbers from other hardware say nothing about this run
+        print(f"{level} no baseline recorded on this hardware ({key}); baselines exist for: "
+              f"{'; '.join(machines) or 'none'}. Record one with --update-baseline.", file=sys.stderr)
+        return 0 if args.allow_missing_baseline else 1
+    baseline = machines[key]['results']
+
+    regressions = compare(results, baseline, args.tolerance, args.min_delta_ms / 1000)
+    for regression in regressions:
+        print(f"REGRESSION {regression}", file=sys.stderr)
+    # An unmeasured scenario is not a passing one
+    missing = [name for name in results if name not in baseline]
+    if missing:
+        print(f"{level} no baseline for: {', '.join(missing)}", file=sys.stderr)
+    if skipped:
+        print(f"{level} not measured: {', '.join(skipped)}", file=sys.stderr)
+    if regressions or ((missing or skipped) and not args.allow_missing_baseline):
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())